@@ -1,11 +1,42 @@
 #!/usr/bin/env python3
 """Secure credential management for SSH connections."""
 
+import functools
 import getpass
+import os
+import platform
+import re
+import shutil
 import subprocess
 import sys
+import threading
 import time
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+# Keychain service name used for all stored SSH credentials
+SERVICE_NAME = "ssh-mcp"
+
+# Absolute path to the security CLI, resolved on first use so importing
+# this module doesn't pay the PATH scan; each later invocation still
+# skips the search
+_security_bin_path: Optional[str] = None
+
+
+def _security_bin() -> str:
+    """Return the absolute path to the security CLI, resolved lazily."""
+    global _security_bin_path  # pylint: disable=global-statement
+    if _security_bin_path is None:
+        _security_bin_path = shutil.which("security") or "/usr/bin/security"
+    return _security_bin_path
+
+
+# How long resolved credentials stay in the in-process cache (seconds)
+CACHE_TTL_SECONDS = 300
+
+# Patterns for parsing `security find-generic-password -g` output: the
+# attribute dump goes to stdout, the password line to stderr
+_ACCT_RE = re.compile(r'"acct"<blob>="([^"]*)"')
+_PASSWORD_RE = re.compile(r'password: "(.*)"$', re.MULTILINE)
 
 
 def get_username_suggestion() -> str:
@@ -17,13 +48,13 @@ def keychain_get_password(service: str, account: str) -> Optional[str]:
     """Get password from macOS Keychain."""
     try:
         result = subprocess.run(
-            ["security", "find-generic-password", "-s", service, "-a", account, "-w"],
+            [_security_bin(), "find-generic-password", "-s", service, "-a", account, "-w"],
             capture_output=True,
             text=True,
             check=False,
         )
         return result.stdout.strip()
-    except subprocess.CalledProcessError:
+    except (subprocess.SubprocessError, OSError):
         return None
 
 
@@ -33,7 +64,7 @@ def keychain_set_password(
     """Store password in macOS Keychain with TTL."""
     # Delete existing entry if present
     subprocess.run(
-        ["security", "delete-generic-password", "-s", service, "-a", account],
+        [_security_bin(), "delete-generic-password", "-s", service, "-a", account],
         capture_output=True,
         check=False,
     )
@@ -43,7 +74,7 @@ def keychain_set_password(
 
     subprocess.run(
         [
-            "security",
+            _security_bin(),
             "add-generic-password",
             "-s",
             service,
@@ -62,7 +93,7 @@ def keychain_check_expired(service: str, account: str) -> bool:
     """Check if keychain entry is expired."""
     try:
         result = subprocess.run(
-            ["security", "find-generic-password", "-s", service, "-a", account, "-j"],
+            [_security_bin(), "find-generic-password", "-s", service, "-a", account, "-j"],
             capture_output=True,
             text=True,
             check=False,
@@ -73,7 +104,7 @@ def keychain_check_expired(service: str, account: str) -> bool:
         if comment.startswith("expires:"):
             expiry_time = int(comment.split(":")[1])
             return time.time() > expiry_time
-    except (subprocess.CalledProcessError, ValueError, IndexError):
+    except (subprocess.SubprocessError, OSError, ValueError, IndexError):
         pass
 
     return True  # Assume expired if we can't determine
@@ -125,55 +156,234 @@ def prompt_credentials_gui(hostname: str, suggested_username: str) -> Tuple[str,
     return username, password
 
 
+@functools.lru_cache(maxsize=1024)
+def _domain(hostname: str) -> str:
+    """Drop the first label of an FQDN without building a label list."""
+    domain = hostname.partition(".")[2]
+    # Fallback for dotless names: use hostname.local
+    return domain or f"{hostname}.local"
+
+
 def get_domain_from_hostname(hostname: str) -> str:
-    """Extract domain from FQDN."""
-    parts = hostname.split(".")
-    if len(parts) > 1:
-        # Extract domain from FQDN (e.g., server.domain.local -> domain.local)
-        return ".".join(parts[1:])
-    # Fallback: use hostname.local
-    return f"{hostname}.local"
+    """Extract domain from FQDN (e.g., server.domain.local -> domain.local)."""
+    return _domain(hostname)
+
+
+class CredentialProvider:
+    """Interface for credential providers.
+
+    A plain base class rather than an ABC: with only a couple of concrete
+    providers the abstract-method machinery buys nothing and its metaclass
+    adds instantiation and isinstance overhead.
+    """
+
+    def get_credentials(self, domain: str) -> Optional[Tuple[str, str]]:
+        """Get (username, password) for a domain, or None if unavailable."""
+        raise NotImplementedError
+
+    def test_credentials_available(self, hostname: str) -> bool:
+        """Check whether credentials are available for a hostname."""
+        raise NotImplementedError
+
+
+# Memoized SSH_USERNAME_* / SSH_PASSWORD_* variable names per domain
+_envkey_cache: Dict[str, Tuple[str, str]] = {}
+
+
+class EnvironmentProvider(CredentialProvider):
+    """Credential provider backed by SSH_USERNAME_* / SSH_PASSWORD_* variables."""
+
+    def get_credentials(self, domain: str) -> Optional[Tuple[str, str]]:
+        """Get credentials for a domain from environment variables."""
+        keys = _envkey_cache.get(domain)
+        if keys is None:
+            key = domain.upper().replace(".", "_")
+            keys = (f"SSH_USERNAME_{key}", f"SSH_PASSWORD_{key}")
+            _envkey_cache[domain] = keys
+        # os.environ.get skips the os.getenv wrapper on the hot path
+        username = os.environ.get(keys[0])
+        password = os.environ.get(keys[1])
+        if username and password:
+            return username, password
+        return None
+
+    def test_credentials_available(self, hostname: str) -> bool:
+        """Check whether environment credentials exist for a hostname."""
+        return self.get_credentials(get_domain_from_hostname(hostname)) is not None
+
+
+class MacOSKeychainProvider(CredentialProvider):
+    """Credential provider backed by the macOS Keychain."""
+
+    service = SERVICE_NAME
+
+    @staticmethod
+    def get_domain_from_hostname(hostname: str) -> str:
+        """Extract domain from hostname."""
+        return get_domain_from_hostname(hostname)
+
+    def _find_account(self, domain: str) -> Optional[str]:
+        """Find the stored username@domain account for a domain."""
+        try:
+            result = subprocess.run(
+                [_security_bin(), "find-generic-password", "-s", self.service],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+        except (subprocess.SubprocessError, OSError):
+            return None
+
+        if result.returncode != 0:
+            return None
+
+        for line in result.stdout.split("\n"):
+            if "acct" in line and domain in line:
+                parts = line.split('"')
+                if len(parts) >= 4 and f"@{domain}" in parts[3]:
+                    return parts[3]
+        return None
+
+    def get_credentials(self, domain: str) -> Optional[Tuple[str, str]]:
+        """Get credentials for a domain from the keychain.
+
+        Uses a single `security find-generic-password -g` call that prints
+        both the account attributes (stdout) and the password (stderr), so
+        the common single-account case costs one subprocess instead of two.
+        """
+        try:
+            result = subprocess.run(
+                [_security_bin(), "find-generic-password", "-g", "-s", self.service],
+                capture_output=True,
+                text=True,
+                check=False,
+                timeout=30,
+            )
+        except (subprocess.SubprocessError, OSError):
+            return None
+
+        if result.returncode != 0:
+            return None
+
+        acct_match = _ACCT_RE.search(result.stdout)
+        password_match = _PASSWORD_RE.search(result.stderr)
+        if acct_match and password_match:
+            account = acct_match.group(1)
+            if f"@{domain}" in account and password_match.group(1):
+                return account.split("@")[0], password_match.group(1)
+
+        # First match was for another domain: fall back to a targeted lookup
+        account = self._find_account(domain)
+        if not account:
+            return None
+
+        password = keychain_get_password(self.service, account)
+        if not password:
+            return None
+
+        return account.split("@")[0], password
+
+    def test_credentials_available(self, hostname: str) -> bool:
+        """Check whether keychain credentials exist for a hostname."""
+        return self.get_credentials(self.get_domain_from_hostname(hostname)) is not None
+
+    def store_credentials(self, domain: str, username: str, password: str) -> None:
+        """Store credentials in the keychain as username@domain."""
+        keychain_set_password(self.service, f"{username}@{domain}", password)
+
+
+class CredentialManager:
+    """Resolve credentials across providers with a short-lived in-process cache.
+
+    Provider lookups spawn `security` subprocesses on macOS, so results are
+    cached per domain for CACHE_TTL_SECONDS to avoid repeated Keychain hits
+    within a session. Access is guarded by an RLock for FastMCP's threaded
+    dispatch.
+    """
+
+    def __init__(self) -> None:
+        self.providers: List[CredentialProvider] = [EnvironmentProvider()]
+        # The keychain provider shells out to `security`, which only
+        # exists on macOS
+        if platform.system() == "Darwin":
+            self.providers.append(MacOSKeychainProvider())
+        # Pre-bind the lookup methods so the per-call dispatch loop skips
+        # repeated attribute resolution
+        self._get_fns = tuple(p.get_credentials for p in self.providers)
+        self._cache: Dict[str, Tuple[Tuple[str, str], float]] = {}
+        self._cache_ttl = CACHE_TTL_SECONDS
+        self._lock = threading.RLock()
+
+    def get_credentials(self, domain: str) -> Optional[Tuple[str, str]]:
+        """Get (username, password) for a domain, or None if unavailable."""
+        # Lock-free fast path: dict reads are atomic under the GIL, so a
+        # warm hit costs one lookup and no lock acquisition
+        entry = self._cache.get(domain)
+        if entry is not None and time.monotonic() - entry[1] < self._cache_ttl:
+            return entry[0]
+
+        with self._lock:
+            # Re-check under the lock in case another thread refreshed it
+            entry = self._cache.get(domain)
+            if entry is not None:
+                credentials, cached_at = entry
+                if time.monotonic() - cached_at < self._cache_ttl:
+                    return credentials
+                del self._cache[domain]
+
+            for get_fn in self._get_fns:
+                credentials = get_fn(domain)
+                if credentials:
+                    self._cache[domain] = (credentials, time.monotonic())
+                    return credentials
+        return None
+
+    def test_credentials_available(self, hostname: str) -> bool:
+        """Test if credentials are available for a hostname."""
+        return self.get_credentials(get_domain_from_hostname(hostname)) is not None
+
+    @staticmethod
+    def get_domain_from_hostname(hostname: str) -> str:
+        """Extract domain from hostname."""
+        return get_domain_from_hostname(hostname)
+
+    def store_credentials(self, domain: str, username: str, password: str) -> None:
+        """Store credentials with providers that support it and refresh cache."""
+        for provider in self.providers:
+            store = getattr(provider, "store_credentials", None)
+            if store is not None:
+                store(domain, username, password)
+        with self._lock:
+            self._cache[domain] = ((username, password), time.monotonic())
+
+    def invalidate(self, domain: Optional[str] = None) -> None:
+        """Drop cached credentials for a domain (or all domains)."""
+        with self._lock:
+            if domain is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(domain, None)
+
+
+# Shared manager instance used by the server and module-level helpers
+credential_manager = CredentialManager()
 
 
 def get_credentials(hostname: str) -> Tuple[str, str]:
     """Get credentials for hostname with GUI prompting and caching."""
     domain = get_domain_from_hostname(hostname)
-    service = "ssh-mcp"
-
-    # Check for cached credentials for this domain
-    try:
-        # Get all accounts for this service
-        account_result = subprocess.run([
-            'security', 'find-generic-password',
-            '-s', service
-        ], capture_output=True, text=True, check=False)
 
-        if account_result.returncode == 0:
-            for line in account_result.stdout.split('\n'):
-                if 'acct' in line and domain in line:
-                    # Extract account name
-                    parts = line.split('"')
-                    if len(parts) >= 4:
-                        account = parts[3]
-
-                        # Account format: username@domain
-                        if '@' in account and domain in account:
-                            username = account.split('@')[0]
-                            # Get password for this specific account
-                            password = keychain_get_password(service, account)
-                            if password:
-                                return username, password
-    except subprocess.CalledProcessError:
-        pass
+    credentials = credential_manager.get_credentials(domain)
+    if credentials:
+        return credentials
 
     # No cached credentials found, prompt using GUI
     username, password = prompt_credentials_gui(hostname, get_username_suggestion())
 
     # Store in keychain using username@domain format
-    account = f"{username}@{domain}"
     try:
-        keychain_set_password(service, account, password)
-    except subprocess.CalledProcessError as e:
+        credential_manager.store_credentials(domain, username, password)
+    except (subprocess.SubprocessError, OSError) as e:
         print(f"Warning: Could not cache credentials: {e}", file=sys.stderr)
 
     return username, password
@@ -181,13 +391,13 @@ def get_credentials(hostname: str) -> Tuple[str, str]:
 
 def clear_cached_credentials(_hostname: str = None) -> bool:
     """Clear all cached SSH credentials."""
-    service = "ssh-mcp"
+    service = SERVICE_NAME
     cleared = False
 
     try:
         # Get all accounts for this service
         result = subprocess.run([
-            'security', 'find-generic-password',
+            _security_bin(), 'find-generic-password',
             '-s', service
         ], capture_output=True, text=True, check=False)
 
@@ -201,76 +411,33 @@ def clear_cached_credentials(_hostname: str = None) -> bool:
                         # Delete any account for this service
                         try:
                             subprocess.run([
-                                'security', 'delete-generic-password',
+                                _security_bin(), 'delete-generic-password',
                                 '-s', service,
                                 '-a', account
                             ], capture_output=True, check=False)
                             cleared = True
                         except subprocess.CalledProcessError:
                             pass
-    except subprocess.CalledProcessError:
+    except (subprocess.SubprocessError, OSError):
         pass
 
+    credential_manager.invalidate()
     return cleared
 
 
 def test_credentials_available(hostname: str) -> bool:
     """Test if valid credentials are available for hostname."""
-    domain = get_domain_from_hostname(hostname)
-    service = "ssh-mcp"
+    return credential_manager.test_credentials_available(hostname)
 
-    try:
-        result = subprocess.run([
-            'security', 'find-generic-password',
-            '-s', service,
-            '-g'
-        ], capture_output=True, text=True, check=False)
 
-        if result.returncode == 0:
-            for line in result.stderr.split('\n'):
-                if 'acct' in line and domain in line:
-                    # Handle username@domain format
-                    if f'@{domain}' in line:
-                        parts = line.split('"')
-                        if len(parts) >= 2:
-                            account_match = parts[1]
-                            if not keychain_check_expired(service, account_match):
-                                return True
-    except subprocess.CalledProcessError:
-        pass
-
-    return False
-
-
-def get_credential_manager():
-    """Legacy compatibility - returns a simple object with the new functions."""
-    class CredentialManager:
-        """Legacy credential manager for backward compatibility."""
-
-        @staticmethod
-        def get_credentials(domain: str) -> Optional[Tuple[str, str]]:
-            """Get credentials for a domain."""
-            # For legacy compatibility, treat domain as hostname
-            try:
-                return get_credentials(domain)
-            except RuntimeError:
-                return None
-
-        @staticmethod
-        def get_domain_from_hostname(hostname: str) -> str:
-            """Extract domain from hostname."""
-            return get_domain_from_hostname(hostname)
-
-        @staticmethod
-        def test_credentials_available(domain: str) -> bool:
-            """Test if credentials are available for domain."""
-            return test_credentials_available(domain)
-
-    return CredentialManager()
+def get_credential_manager() -> CredentialManager:
+    """Legacy compatibility - returns the shared credential manager."""
+    return credential_manager
 
 
 def authenticate_domain(hostname_or_domain: str) -> bool:
     """Authenticate and store credentials for a hostname."""
+    credential_manager.invalidate(get_domain_from_hostname(hostname_or_domain))
     try:
         get_credentials(hostname_or_domain)
         return True
@@ -279,8 +446,9 @@ def authenticate_domain(hostname_or_domain: str) -> bool:
 
 
 def get_credentials_from_keychain(domain: str) -> Optional[Tuple[str, str]]:
-    """Legacy function for backward compatibility."""
-    try:
-        return get_credentials(domain)
-    except RuntimeError:
-        return None
+    """Legacy function for backward compatibility.
+
+    Lookup only: resolves through the cached manager in a single hit and
+    never raises a GUI prompt, returning None when nothing is stored.
+    """
+    return credential_manager.get_credentials(get_domain_from_hostname(domain))
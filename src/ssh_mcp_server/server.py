@@ -1,18 +1,29 @@
 #!/usr/bin/env python3
 """SSH MCP Server - Main server implementation."""
 
-import subprocess
-from typing import Dict, Any
+import base64
+import contextlib
+import contextvars
+import ctypes
+import re
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set, Tuple
 
-import paramiko
 from mcp.server.fastmcp import FastMCP
 
+# paramiko is imported lazily inside the SSH tools: it pulls in the
+# cryptography C-extension stack, which is a large cold-start cost for
+# tool calls that never touch SSH
+
 from .credentials import (
+    credential_manager,
     get_credentials,
     clear_cached_credentials,
     get_domain_from_hostname,
     get_username_suggestion,
-    keychain_get_password
 )
 
 # Create MCP server
@@ -21,96 +32,465 @@ mcp = FastMCP("SSH Server")
 # SSH connection timeout
 SSH_TIMEOUT = 30
 
+# How long a pooled SSH connection may sit idle before being discarded
+SSH_POOL_IDLE_SECONDS = 300
+
+# Cap on buffered remote output per stream; anything beyond is dropped
+MAX_OUTPUT_BYTES = 4 * 1024 * 1024
+
+# Marker appended to output that hit MAX_OUTPUT_BYTES
+TRUNCATION_MARKER = "\n...[output truncated]"
+
+# Leading sudo password prompt that sudo -S writes to stderr
+_SUDO_PROMPT_RE = re.compile(r'^\[sudo\] password for [^:]+:\s*\n?')
+
+# How long a remote sudo timestamp is trusted after a successful -S run;
+# kept under sudo's default 5 minutes to absorb clock skew
+SUDO_TIMESTAMP_SECONDS = 270
+
+# When (hostname, username) last authenticated to sudo successfully
+_sudo_validated: Dict[Tuple[str, str], float] = {}
+
+# (hostname, username) pairs whose sudo timestamp turned out not to
+# carry across exec channels (sudoers timestamp_type=tty); the sudo -n
+# probe is pointless there, so each host only ever pays it once
+_sudo_timestamp_unshared: Set[Tuple[str, str]] = set()
+
+# How long a key-auth failure is remembered before keys are retried
+KEY_AUTH_RETRY_SECONDS = 300
+
+# When key auth last failed for (hostname, username); within the window
+# new connections go straight to password auth instead of replaying the
+# ~/.ssh scan, agent round-trip and doomed auth attempt
+_key_auth_failed: Dict[Tuple[str, str], float] = {}
+
+# Pooled SSH connections keyed by (hostname, username) so repeated tool
+# calls reuse the authenticated transport instead of re-handshaking.
+# Entries are [client, last_used, in_use] lists; in_use counts active
+# checkouts so sweeps and replacements never close a client mid-command
+_ssh_pool: Dict[Tuple[str, str], List[Any]] = {}
+_pool_lock = threading.Lock()
+
+# Clients displaced from the pool while still checked out, keyed by
+# id(client) with their outstanding checkout count; closed on release
+_retired_clients: Dict[int, List[Any]] = {}
+
+# How often the background timer sweeps the pool for idle connections
+POOL_EVICTION_INTERVAL = 60
+
+_eviction_timer: Optional[threading.Timer] = None
 
-@mcp.tool()
-def ssh_execute_ssh(hostname: str, command: str) -> Dict[str, Any]:
-    """Execute command on remote Linux host via SSH"""
 
+# Shared missing-host-key policy; AutoAddPolicy is stateless, so one
+# instance serves every client instead of a fresh allocation per call
+_host_key_policy = None
+
+
+def _get_host_key_policy() -> "paramiko.AutoAddPolicy":
+    """Return the shared AutoAddPolicy, created on first use."""
+    global _host_key_policy  # pylint: disable=global-statement
+    if _host_key_policy is None:
+        import paramiko  # pylint: disable=import-outside-toplevel
+        _host_key_policy = paramiko.AutoAddPolicy()
+    return _host_key_policy
+
+
+def _wipe(secret: bytearray) -> None:
+    """Zero a mutable secret buffer in place.
+
+    Assigning None to a str leaves the password bytes in the heap until
+    GC; a bytearray can actually be overwritten, and ctypes.memset can't
+    be optimized away.
+    """
+    if secret:
+        ctypes.memset(
+            (ctypes.c_char * len(secret)).from_buffer(secret), 0, len(secret)
+        )
+
+
+def _close_quietly(client: "paramiko.SSHClient") -> None:
+    """Close an SSH client, ignoring errors from dead transports."""
     try:
-        # Create SSH client
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.close()
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+
+def _get_pooled_client(hostname: str, username: str) -> Optional["paramiko.SSHClient"]:
+    """Check out a live pooled client for (hostname, username), or None.
+
+    A returned client is marked in use and must be handed back with
+    _release_client once its command finishes.
+    """
+    key = (hostname, username)
+    now = time.monotonic()
+    with _pool_lock:
+        entry = _ssh_pool.get(key)
+        if entry is None:
+            return None
+        client, last_used, in_use = entry
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            del _ssh_pool[key]
+            if in_use:
+                # Still executing elsewhere; close when the last user releases
+                _retired_clients[id(client)] = [client, in_use]
+            else:
+                _close_quietly(client)
+            return None
+        if in_use == 0 and now - last_used > SSH_POOL_IDLE_SECONDS:
+            del _ssh_pool[key]
+            _close_quietly(client)
+            return None
+        entry[1] = now
+        entry[2] += 1
+        return client
+
+
+def _checkout_client(client: "paramiko.SSHClient") -> bool:
+    """Mark an already-held client as in use so sweeps can't close it.
+
+    Returns False when the client is no longer tracked (e.g. a session
+    client the pool never saw), in which case there is nothing to release.
+    """
+    with _pool_lock:
+        for entry in _ssh_pool.values():
+            if entry[0] is client:
+                entry[2] += 1
+                return True
+        retired = _retired_clients.get(id(client))
+        if retired is not None:
+            retired[1] += 1
+            return True
+    return False
+
+
+def _release_client(client: "paramiko.SSHClient") -> None:
+    """Return a checked-out client to the pool.
+
+    Stamps last_used at release so idle time is measured from command
+    completion, and closes clients that were displaced from the pool
+    once their last user lets go.
+    """
+    with _pool_lock:
+        for entry in _ssh_pool.values():
+            if entry[0] is client:
+                entry[1] = time.monotonic()
+                if entry[2] > 0:
+                    entry[2] -= 1
+                return
+        retired = _retired_clients.get(id(client))
+        if retired is not None:
+            retired[1] -= 1
+            if retired[1] <= 0:
+                del _retired_clients[id(client)]
+                _close_quietly(client)
+
+
+def _evict_idle_connections() -> None:
+    """Close pooled connections that are idle past the limit and unused."""
+    global _eviction_timer  # pylint: disable=global-statement
+    now = time.monotonic()
+    with _pool_lock:
+        for key in list(_ssh_pool):
+            client, last_used, in_use = _ssh_pool[key]
+            if in_use:
+                # A command is still running on it; never close mid-flight
+                continue
+            transport = client.get_transport()
+            if (transport is None or not transport.is_active()
+                    or now - last_used > SSH_POOL_IDLE_SECONDS):
+                del _ssh_pool[key]
+                _close_quietly(client)
+        if _ssh_pool:
+            _eviction_timer = threading.Timer(
+                POOL_EVICTION_INTERVAL, _evict_idle_connections
+            )
+            _eviction_timer.daemon = True
+            _eviction_timer.start()
+        else:
+            # Nothing left to watch; the next _pool_client restarts the timer
+            _eviction_timer = None
+
+
+def _pool_client(hostname: str, username: str, client: "paramiko.SSHClient") -> None:
+    """Add a connected client to the pool, checked out by the caller.
+
+    A displaced entry that is still executing on another thread is moved
+    aside and closed on its release rather than yanked mid-command.
+    """
+    global _eviction_timer  # pylint: disable=global-statement
+    with _pool_lock:
+        old = _ssh_pool.get((hostname, username))
+        if old is not None and old[0] is not client:
+            if old[2]:
+                _retired_clients[id(old[0])] = [old[0], old[2]]
+            else:
+                _close_quietly(old[0])
+        _ssh_pool[(hostname, username)] = [client, time.monotonic(), 1]
+        if _eviction_timer is None:
+            _eviction_timer = threading.Timer(
+                POOL_EVICTION_INTERVAL, _evict_idle_connections
+            )
+            _eviction_timer.daemon = True
+            _eviction_timer.start()
+
 
+# Session pinned by ssh_session(); checked before the pool so composed
+# tool calls share one client without per-call pool bookkeeping
+_current_session: contextvars.ContextVar = contextvars.ContextVar(
+    "ssh_mcp_current_session", default=None
+)
+
+
+@contextlib.contextmanager
+def ssh_session(hostname: str):
+    """Pin SSH calls to a hostname to a single client for the duration.
+
+    The first tool call inside the context binds its connected client to
+    the session; subsequent calls to the same hostname reuse that client
+    directly, skipping pool lookups and liveness checks.
+    """
+    session: Dict[str, Any] = {"hostname": hostname, "client": None}
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+
+
+def _session_client(hostname: str) -> Optional["paramiko.SSHClient"]:
+    """Return the client pinned for this hostname, if a session is active."""
+    session = _current_session.get()
+    if session is not None and session["hostname"] == hostname:
+        return session["client"]
+    return None
+
+
+def _bind_session_client(hostname: str, client: "paramiko.SSHClient") -> None:
+    """Bind a connected client to the active session for this hostname."""
+    session = _current_session.get()
+    if session is not None and session["hostname"] == hostname:
+        session["client"] = client
+
+
+def _drain_channel(channel, binary: bool = False) -> Tuple[int, Any, Any, bool, bool]:
+    """Drain a channel's stdout and stderr concurrently and collect exit status.
+
+    Interleaves reads of both streams with select() so a full remote stderr
+    pipe can't deadlock the command, caps buffered output per stream at
+    MAX_OUTPUT_BYTES, and picks up the exit status once the remote closes.
+
+    Returns (status, stdout, stderr, stdout_truncated, stderr_truncated).
+    With binary=True the streams are returned as raw bytes, skipping the
+    UTF-8 decode/replacement pass; truncation is reported only via the
+    flags so the byte streams are never polluted with marker text.
+    """
+    # bytearray buffers grow in place, avoiding a chunk list plus the
+    # intermediate bytes object a join would allocate
+    out_buf = bytearray()
+    err_buf = bytearray()
+    out_truncated = False
+    err_truncated = False
+
+    def _pump() -> bool:
+        nonlocal out_truncated, err_truncated
+        moved = False
+        while channel.recv_ready():
+            chunk = channel.recv(65536)
+            if not chunk:
+                break
+            moved = True
+            if len(out_buf) < MAX_OUTPUT_BYTES:
+                out_buf.extend(chunk)
+            else:
+                out_truncated = True
+        while channel.recv_stderr_ready():
+            chunk = channel.recv_stderr(65536)
+            if not chunk:
+                break
+            moved = True
+            if len(err_buf) < MAX_OUTPUT_BYTES:
+                err_buf.extend(chunk)
+            else:
+                err_truncated = True
+        return moved
+
+    # Poll data and exit status together. The select wakes immediately for
+    # data, but an exit status arriving without payload only gets noticed
+    # on timeout, so keep the timeout short.
+    while not channel.exit_status_ready():
+        select.select([channel], [], [], 0.1)
+        _pump()
+
+    # Remote closed the channel: drain whatever is still queued
+    while _pump():
+        pass
+
+    exit_status = channel.recv_exit_status()
+    if binary:
+        return exit_status, bytes(out_buf), bytes(err_buf), out_truncated, err_truncated
+    stdout_text = out_buf.decode('utf-8', errors='replace')
+    stderr_text = err_buf.decode('utf-8', errors='replace')
+    if out_truncated:
+        stdout_text += TRUNCATION_MARKER
+    if err_truncated:
+        stderr_text += TRUNCATION_MARKER
+    return exit_status, stdout_text, stderr_text, out_truncated, err_truncated
+
+
+def close_pooled_connections() -> None:
+    """Close and drop all pooled SSH connections."""
+    global _eviction_timer  # pylint: disable=global-statement
+    with _pool_lock:
+        if _eviction_timer is not None:
+            _eviction_timer.cancel()
+            _eviction_timer = None
+        for entry in _ssh_pool.values():
+            _close_quietly(entry[0])
+        _ssh_pool.clear()
+        for retired in _retired_clients.values():
+            _close_quietly(retired[0])
+        _retired_clients.clear()
+
+
+@mcp.tool()
+def ssh_execute_ssh(hostname: str, command: str, binary: bool = False,
+                    combine_stderr: bool = False) -> Dict[str, Any]:
+    """Execute command on remote Linux host via SSH
+
+    With binary=True, stdout/stderr are returned as raw bytes instead of
+    decoded text, skipping the UTF-8 validation pass on large outputs.
+
+    With combine_stderr=True, stderr is merged into the stdout stream on
+    the remote side, halving the recv bookkeeping for callers that don't
+    distinguish the streams; the result's "stderr" field is then empty.
+    """
+    import paramiko  # pylint: disable=import-outside-toplevel
+
+    try:
         # Check if we have cached credentials to get the correct username
         domain = get_domain_from_hostname(hostname)
-        cached_username = None
-        try:
-            service = "ssh-mcp"
-            account_result = subprocess.run([
-                'security', 'find-generic-password',
-                '-s', service
-            ], capture_output=True, text=True, check=False)
-
-            if account_result.returncode == 0:
-                for line in account_result.stdout.split('\n'):
-                    if 'acct' in line and domain in line:
-                        parts = line.split('"')
-                        if len(parts) >= 4:
-                            account = parts[3]
-                            if '@' in account and domain in account:
-                                cached_username = account.split('@')[0]
-                                break
-        except (subprocess.SubprocessError, OSError):
-            pass
+        cached = credential_manager.get_credentials(domain)
+        cached_username = cached[0] if cached else None
 
         # Use cached username if available, otherwise current user
         ssh_username = cached_username if cached_username else get_username_suggestion()
 
-        # First try key-based authentication
-        try:
-            ssh.connect(
-                hostname=hostname,
-                username=ssh_username,
-                timeout=SSH_TIMEOUT,
-                look_for_keys=True,
-                allow_agent=True
-            )
-        except paramiko.AuthenticationException:
-            # Key auth failed, try password authentication
-            try:
-                username, password = get_credentials(hostname)
-                ssh.connect(
-                    hostname=hostname,
-                    username=username,
-                    password=password,
-                    timeout=SSH_TIMEOUT,
-                    look_for_keys=False,
-                    allow_agent=False
-                )
-                # Clear password from memory
-                password = None
-            except RuntimeError as e:
-                error_msg = str(e)
-                if "cancelled" in error_msg.lower():
+        # Reuse the session-pinned client, then a pooled connection; both
+        # are checked out so pool maintenance can't close them mid-command
+        ssh = _session_client(hostname)
+        checked_out = ssh is not None and _checkout_client(ssh)
+        if ssh is None:
+            ssh = _get_pooled_client(hostname, ssh_username)
+            checked_out = ssh is not None
+        if ssh is None:
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(_get_host_key_policy())
+
+            # First try key-based authentication, unless keys failed here
+            # recently - then skip the doomed attempt entirely
+            keys_failed_at = _key_auth_failed.get((hostname, ssh_username))
+            key_auth_ok = False
+            if (keys_failed_at is None
+                    or time.monotonic() - keys_failed_at >= KEY_AUTH_RETRY_SECONDS):
+                try:
+                    ssh.connect(
+                        hostname=hostname,
+                        username=ssh_username,
+                        timeout=SSH_TIMEOUT,
+                        banner_timeout=SSH_TIMEOUT,
+                        look_for_keys=True,
+                        allow_agent=True,
+                        compress=True
+                    )
+                    _pool_client(hostname, ssh_username, ssh)
+                    checked_out = True
+                    _key_auth_failed.pop((hostname, ssh_username), None)
+                    key_auth_ok = True
+                except paramiko.AuthenticationException:
+                    # Only a real connect failure starts the retry window;
+                    # recording skips too would keep refreshing it and keys
+                    # would never be retried on frequently used hosts
+                    _key_auth_failed[(hostname, ssh_username)] = time.monotonic()
+            if not key_auth_ok:
+                # Key auth failed, try password authentication
+                try:
+                    username, password = get_credentials(hostname)
+                    ssh.connect(
+                        hostname=hostname,
+                        username=username,
+                        password=password,
+                        timeout=SSH_TIMEOUT,
+                        banner_timeout=SSH_TIMEOUT,
+                        look_for_keys=False,
+                        allow_agent=False,
+                        compress=True
+                    )
+                    _pool_client(hostname, username, ssh)
+                    checked_out = True
+                    # Clear password from memory
+                    password = None
+                except RuntimeError as e:
+                    error_msg = str(e)
+                    if "cancelled" in error_msg.lower():
+                        return {
+                            "error": "Authentication cancelled by user",
+                            "details": error_msg,
+                            "troubleshooting": [
+                                "User clicked Cancel in authentication dialog",
+                                "Authentication dialog may have timed out"
+                            ],
+                            "suggested_action": f"Try again: ssh_setup_credentials('{hostname}')"
+                        }
                     return {
-                        "error": "Authentication cancelled by user",
+                        "error": "Credential setup failed",
                         "details": error_msg,
                         "troubleshooting": [
-                            "User clicked Cancel in authentication dialog",
-                            "Authentication dialog may have timed out"
-                        ],
-                        "suggested_action": f"Try again: ssh_setup_credentials('{hostname}')"
+                            "SSH key authentication failed",
+                            "Password authentication setup failed",
+                            "Check if hostname is correct"
+                        ]
                     }
-                return {
-                    "error": "Credential setup failed",
-                    "details": error_msg,
-                    "troubleshooting": [
-                        "SSH key authentication failed",
-                        "Password authentication setup failed",
-                        "Check if hostname is correct"
-                    ]
-                }
 
-        # Execute command
-        _, stdout, stderr = ssh.exec_command(command)
+        _bind_session_client(hostname, ssh)
 
-        # Get results
-        exit_status = stdout.channel.recv_exit_status()
-        stdout_text = stdout.read().decode('utf-8', errors='replace')
-        stderr_text = stderr.read().decode('utf-8', errors='replace')
+        try:
+            # Execute command; no pseudo-terminal, so output arrives unframed
+            # and the exit status isn't delayed by pty teardown
+            if combine_stderr:
+                # Merge stderr into the stdout queue remotely so draining
+                # polls a single stream
+                channel = ssh.get_transport().open_session()
+                channel.set_combine_stderr(True)
+                channel.exec_command(command)
+            else:
+                _, stdout, _ = ssh.exec_command(command, get_pty=False)
+                channel = stdout.channel
 
-        # Close connection
-        ssh.close()
+            # Stream results without buffering unbounded output
+            exit_status, stdout_text, stderr_text, out_truncated, err_truncated = (
+                _drain_channel(channel, binary=binary)
+            )
+        finally:
+            # Connection stays open in the pool for subsequent calls
+            if checked_out:
+                _release_client(ssh)
+
+        if binary:
+            # Raw bytes can't survive JSON serialization (the transport
+            # rejects non-UTF-8), so ship them base64-encoded and flag
+            # truncation separately instead of appending marker text
+            return {
+                "status": exit_status,
+                "stdout": base64.b64encode(stdout_text).decode('ascii'),
+                "stderr": base64.b64encode(stderr_text).decode('ascii'),
+                "encoding": "base64",
+                "stdout_truncated": out_truncated,
+                "stderr_truncated": err_truncated,
+                "hostname": hostname,
+                "command": command
+            }
 
         return {
             "status": exit_status,
@@ -149,88 +529,143 @@ def ssh_execute_ssh(hostname: str, command: str) -> Dict[str, Any]:
 @mcp.tool()
 def ssh_execute_sudo(hostname: str, command: str) -> Dict[str, Any]:
     """Execute command with sudo on remote Linux host"""
+    import paramiko  # pylint: disable=import-outside-toplevel
 
     try:
         # Get domain and check for cached credentials
         domain = get_domain_from_hostname(hostname)
-        cached_username = None
-        cached_password = None
-
-        try:
-            service = "ssh-mcp"
-            account_result = subprocess.run([
-                'security', 'find-generic-password',
-                '-s', service
-            ], capture_output=True, text=True, check=False)
-
-            if account_result.returncode == 0:
-                for line in account_result.stdout.split('\n'):
-                    if 'acct' in line and domain in line:
-                        parts = line.split('"')
-                        if len(parts) >= 4:
-                            account = parts[3]
-                            if '@' in account and domain in account:
-                                cached_username = account.split('@')[0]
-                                cached_password = keychain_get_password(service, account)
-                                break
-        except (subprocess.SubprocessError, OSError):
-            pass
+        cached = credential_manager.get_credentials(domain)
+        if cached:
+            cached_username, cached_password = cached
+        else:
+            cached_username = None
+            cached_password = None
 
         # Use cached username if available, otherwise current user
         ssh_username = cached_username if cached_username else get_username_suggestion()
 
-        # Create SSH client
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        # First try key-based authentication
-        try:
-            ssh.connect(
-                hostname=hostname,
-                username=ssh_username,
-                timeout=SSH_TIMEOUT,
-                look_for_keys=True,
-                allow_agent=True
-            )
-        except paramiko.AuthenticationException:
-            # Key auth failed, use password auth
-            if cached_password:
-                username, password = cached_username, cached_password
-            else:
-                username, password = get_credentials(hostname)
-
-            ssh.connect(
-                hostname=hostname,
-                username=username,
-                password=password,
-                timeout=SSH_TIMEOUT,
-                look_for_keys=False,
-                allow_agent=False
-            )
-
-        # For sudo, we need a password
-        if not cached_password:
-            # We connected with keys but need password for sudo
-            username, password = get_credentials(hostname)
-            cached_password = password
+        # Reuse the session-pinned client, then a pooled connection; both
+        # are checked out so pool maintenance can't close them mid-command
+        ssh = _session_client(hostname)
+        checked_out = ssh is not None and _checkout_client(ssh)
+        if ssh is None:
+            ssh = _get_pooled_client(hostname, ssh_username)
+            checked_out = ssh is not None
+        if ssh is None:
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(_get_host_key_policy())
+
+            # First try key-based authentication, unless keys failed here
+            # recently - then skip the doomed attempt entirely
+            keys_failed_at = _key_auth_failed.get((hostname, ssh_username))
+            key_auth_ok = False
+            if (keys_failed_at is None
+                    or time.monotonic() - keys_failed_at >= KEY_AUTH_RETRY_SECONDS):
+                try:
+                    ssh.connect(
+                        hostname=hostname,
+                        username=ssh_username,
+                        timeout=SSH_TIMEOUT,
+                        banner_timeout=SSH_TIMEOUT,
+                        look_for_keys=True,
+                        allow_agent=True,
+                        compress=True
+                    )
+                    _pool_client(hostname, ssh_username, ssh)
+                    checked_out = True
+                    _key_auth_failed.pop((hostname, ssh_username), None)
+                    key_auth_ok = True
+                except paramiko.AuthenticationException:
+                    # Only a real connect failure starts the retry window;
+                    # recording skips too would keep refreshing it and keys
+                    # would never be retried on frequently used hosts
+                    _key_auth_failed[(hostname, ssh_username)] = time.monotonic()
+            if not key_auth_ok:
+                # Key auth failed, use password auth
+                if cached_password:
+                    username, password = cached_username, cached_password
+                else:
+                    username, password = get_credentials(hostname)
 
-        # Execute sudo command with password via stdin
-        stdin, stdout, stderr = ssh.exec_command(f"sudo -S {command}")
-        stdin.write(f"{cached_password}\n")
-        stdin.flush()
+                ssh.connect(
+                    hostname=hostname,
+                    username=username,
+                    password=password,
+                    timeout=SSH_TIMEOUT,
+                    banner_timeout=SSH_TIMEOUT,
+                    look_for_keys=False,
+                    allow_agent=False,
+                    compress=True
+                )
+                _pool_client(hostname, username, ssh)
+                checked_out = True
+                # Remember the password that worked so sudo below doesn't
+                # have to look credentials up a second time
+                cached_username, cached_password = username, password
 
-        # Get results
-        exit_status = stdout.channel.recv_exit_status()
-        stdout_text = stdout.read().decode('utf-8', errors='replace')
-        stderr_text = stderr.read().decode('utf-8', errors='replace')
+        _bind_session_client(hostname, ssh)
 
-        # Clean up sudo password prompt from stderr
-        if stderr_text.startswith('[sudo] password for'):
-            lines = stderr_text.split('\n')
-            stderr_text = '\n'.join(lines[1:])
+        sudo_key = (hostname, cached_username or ssh_username)
+        exit_status = None
+        stdout_text = stderr_text = ""
 
-        # Close connection
-        ssh.close()
+        try:
+            if (sudo_key not in _sudo_timestamp_unshared
+                    and time.monotonic() - _sudo_validated.get(sudo_key, 0.0)
+                    < SUDO_TIMESTAMP_SECONDS):
+                # A recent -S run validated sudo's timestamp: try
+                # non-interactive sudo and skip the password round-trip.
+                # Whether the timestamp carries across exec channels depends
+                # on sudoers timestamp_type; match sudo's exact refusal (and
+                # require no output) so a command that ran and failed is
+                # never re-executed by the -S fallback below.
+                _, stdout, _ = ssh.exec_command(f"sudo -n {command}", get_pty=False)
+                exit_status, stdout_text, stderr_text, _, _ = _drain_channel(
+                    stdout.channel
+                )
+                if (exit_status != 0 and not stdout_text
+                        and stderr_text.startswith("sudo: a password is required")):
+                    # The timestamp doesn't carry on this host; remember that
+                    # so the doomed probe is never repeated
+                    _sudo_timestamp_unshared.add(sudo_key)
+                    _sudo_validated.pop(sudo_key, None)
+                    exit_status = None
+
+            if exit_status is None:
+                # For sudo, we need a password
+                if not cached_password:
+                    # We connected with keys but need password for sudo
+                    username, password = get_credentials(hostname)
+                    cached_password = password
+
+                # Execute sudo command, feeding the password via stdin from a
+                # wipeable buffer
+                stdin, stdout, _ = ssh.exec_command(f"sudo -S {command}", get_pty=False)
+                secret = bytearray(cached_password, 'utf-8')
+                secret.extend(b'\n')
+                try:
+                    stdin.write(secret)
+                    stdin.flush()
+
+                    # Stream results without buffering unbounded output
+                    exit_status, stdout_text, stderr_text, _, _ = _drain_channel(
+                        stdout.channel
+                    )
+                finally:
+                    _wipe(secret)
+
+                # Clean up sudo password prompt from stderr; the cheap prefix
+                # check skips the regex scan when no prompt is present
+                if stderr_text.startswith('[sudo] password for'):
+                    stderr_text = _SUDO_PROMPT_RE.sub('', stderr_text, count=1)
+
+                if (sudo_key not in _sudo_timestamp_unshared
+                        and "incorrect password" not in stderr_text):
+                    _sudo_validated[sudo_key] = time.monotonic()
+        finally:
+            # Connection stays open in the pool for subsequent calls
+            if checked_out:
+                _release_client(ssh)
 
         # Clear password from memory
         cached_password = None
@@ -370,42 +805,139 @@ def ssh_clear_credentials() -> Dict[str, Any]:
         }
 
 
+# Record separator framing the sections of the system-info command
+_SECTION_SEP = "\x1e"
+
+# Remote command strings built once at import; tool bodies and the
+# many-host fan-out then reuse the same interned string on every call
+_CMD_SYSTEM_INFO = (
+    f"printf '{_SECTION_SEP}uname\\n'; uname -a; "
+    f"printf '{_SECTION_SEP}os_release\\n'; "
+    "cat /etc/os-release 2>/dev/null || cat /etc/redhat-release 2>/dev/null "
+    "|| echo 'OS info not available'; "
+    f"printf '{_SECTION_SEP}memory\\n'; free -h; "
+    f"printf '{_SECTION_SEP}disk\\n'; df -h /"
+)
+_CMD_PROCESSES = "ps aux --sort=-%cpu | head -20"
+_CMD_DISK_USAGE = "df -h"
+_CMD_SERVICES = "systemctl list-units --type=service --state=running --no-pager"
+
+
 @mcp.tool()
 def ssh_get_system_info(hostname: str) -> Dict[str, Any]:
     """Get basic system information from Linux host"""
-    command = (
-        "uname -a && cat /etc/os-release 2>/dev/null || "
-        "cat /etc/redhat-release 2>/dev/null || echo 'OS info not available'"
-    )
-    return ssh_execute_ssh(hostname, command)
+    # One SSH exec gathers every section; sentinel framing lets the
+    # output be split into fields client-side, so callers don't issue a
+    # separate tool call per datum
+    result = ssh_execute_ssh(hostname, _CMD_SYSTEM_INFO, combine_stderr=True)
+
+    if "error" not in result:
+        sections: Dict[str, str] = {}
+        for block in result.get("stdout", "").split(_SECTION_SEP):
+            if not block.strip():
+                continue
+            name, _, body = block.partition("\n")
+            sections[name.strip()] = body.strip()
+        result["system_info"] = sections
+    return result
 
 
 @mcp.tool()
 def ssh_get_running_processes(hostname: str) -> Dict[str, Any]:
     """Get running processes from Linux host"""
-    command = "ps aux --sort=-%cpu | head -20"
-    return ssh_execute_ssh(hostname, command)
+    return ssh_execute_ssh(hostname, _CMD_PROCESSES, combine_stderr=True)
 
 
 @mcp.tool()
 def ssh_get_disk_usage(hostname: str) -> Dict[str, Any]:
     """Get disk usage information from Linux host"""
-    command = "df -h"
-    return ssh_execute_ssh(hostname, command)
+    return ssh_execute_ssh(hostname, _CMD_DISK_USAGE, combine_stderr=True)
 
 
 @mcp.tool()
 def ssh_get_services(hostname: str) -> Dict[str, Any]:
     """Get systemd services status from Linux host"""
-    command = "systemctl list-units --type=service --state=running --no-pager"
-    return ssh_execute_ssh(hostname, command)
+    return ssh_execute_ssh(hostname, _CMD_SERVICES, combine_stderr=True)
+
+
+@mcp.tool()
+def ssh_execute_ssh_many(hostnames: List[str], command: str) -> Dict[str, Any]:
+    """Execute command on multiple remote Linux hosts concurrently"""
+    if not hostnames:
+        return {}
+
+    # Paramiko releases the GIL during socket I/O, so threads scale well
+    # for this network-bound fan-out; pooled connections amortize repeats
+    max_workers = min(32, len(hostnames))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(ssh_execute_ssh, host, command): host
+            for host in hostnames
+        }
+        results: Dict[str, Any] = {}
+        for future, host in futures.items():
+            try:
+                results[host] = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                # One host blowing up shouldn't discard the others' results
+                results[host] = {
+                    "error": "SSH execution failed",
+                    "details": str(e),
+                    "hostname": host
+                }
+        return results
+
+
+# Lock file held by a running Puppet agent
+PUPPET_LOCK_FILE = "/var/lib/puppet/state/agent_catalog_run.lock"
+
+# How long a seen lock is trusted before re-probing the host
+PUPPET_LOCK_CACHE_SECONDS = 30
+
+# When each host was last seen holding the agent lock
+_puppet_locked_at: Dict[str, float] = {}
+
+
+def _puppet_locked_error(hostname: str) -> Dict[str, Any]:
+    """Build the error response for a host whose Puppet agent holds the lock."""
+    return {
+        "error": "Puppet agent is already running",
+        "details": f"Lock file {PUPPET_LOCK_FILE} exists on {hostname}",
+        "troubleshooting": [
+            "Another Puppet run is in progress",
+            "A previous run may have left a stale lock file"
+        ],
+        "suggested_action": f"Wait for the run to finish, then retry: ssh_puppet_noop('{hostname}')"
+    }
 
 
 @mcp.tool()
 def ssh_puppet_noop(hostname: str) -> Dict[str, Any]:
     """Run Puppet agent in no-op mode (dry run) with verbose output"""
-    command = "puppet agent --test --noop --verbose"
-    return ssh_execute_sudo(hostname, command)
+    # A lock observed moments ago is still held: answer from the cache
+    # instead of paying the SSH + sudo round-trip again
+    if (time.monotonic() - _puppet_locked_at.get(hostname, 0.0)
+            < PUPPET_LOCK_CACHE_SECONDS):
+        return _puppet_locked_error(hostname)
+
+    # Check the agent lock and run in a single SSH session so the gate
+    # doesn't cost an extra connect + sudo round-trip. The compound
+    # statement is wrapped in sh -c because execute_sudo prepends
+    # "sudo -S ", and sudo only accepts a single command, not shell
+    # control flow
+    command = (
+        f"sh -c 'if [ -e {PUPPET_LOCK_FILE} ]; "
+        "then echo __PUPPET_LOCKED__; exit 2; "
+        "else puppet agent --test --noop --verbose; fi'"
+    )
+    result = ssh_execute_sudo(hostname, command)
+
+    if result.get("status") == 2 and "__PUPPET_LOCKED__" in result.get("stdout", ""):
+        _puppet_locked_at[hostname] = time.monotonic()
+        return _puppet_locked_error(hostname)
+
+    _puppet_locked_at.pop(hostname, None)
+    return result
 
 
 # Legacy compatibility functions
@@ -421,6 +953,12 @@ def execute_sudo(hostname: str, command: str) -> Dict[str, Any]:
     return ssh_execute_sudo(hostname, command)
 
 
+@mcp.tool()
+def execute_ssh_multi(hostnames: List[str], command: str) -> Dict[str, Any]:
+    """Legacy compatibility - Execute command on multiple hosts concurrently"""
+    return ssh_execute_ssh_many(hostnames, command)
+
+
 @mcp.tool()
 def cache_credentials(domain: str) -> Dict[str, Any]:
     """Legacy compatibility - Pre-cache credentials"""
@@ -49,18 +49,21 @@ class TestMacOSKeychainProvider:
         """Test domain extraction from hostname."""
         assert MacOSKeychainProvider.get_domain_from_hostname('host.vocus.local') == 'vocus.local'
         assert MacOSKeychainProvider.get_domain_from_hostname('server.retail.local') == 'retail.local'
-        assert MacOSKeychainProvider.get_domain_from_hostname('simple') == 'simple'
+        assert MacOSKeychainProvider.get_domain_from_hostname('web1.syd.vocus.local') == 'syd.vocus.local'
+        assert MacOSKeychainProvider.get_domain_from_hostname('simple') == 'simple.local'
     
     @patch('subprocess.run')
     def test_get_credentials_success(self, mock_run):
         """Test successful credential retrieval from keychain."""
         provider = MacOSKeychainProvider()
         
-        # Mock successful subprocess calls
-        mock_run.side_effect = [
-            MagicMock(returncode=0, stdout='testuser\n'),  # username
-            MagicMock(returncode=0, stdout='testpass\n')   # password
-        ]
+        # Mock the single `security find-generic-password -g` call: account
+        # attributes on stdout, password on stderr
+        mock_run.return_value = MagicMock(
+            returncode=0,
+            stdout='    "acct"<blob>="testuser@vocus.local"\n',
+            stderr='password: "testpass"\n'
+        )
         
         credentials = provider.get_credentials('vocus.local')
         assert credentials == ('testuser', 'testpass')
@@ -1,88 +1,361 @@
 """Tests for SSH MCP server functionality."""
 
+import asyncio
+import base64
+import json
+import shlex
+import time
+
 import pytest
 from unittest.mock import patch, MagicMock
-from ssh_mcp_server.server import execute_ssh, get_system_info
+
+import paramiko
+
+from ssh_mcp_server import server
+from ssh_mcp_server.server import (
+    mcp,
+    ssh_execute_ssh,
+    ssh_execute_sudo,
+    ssh_execute_ssh_many,
+    ssh_get_system_info,
+    ssh_puppet_noop,
+    ssh_session,
+    close_pooled_connections,
+)
+
+
+def _reset_server_state():
+    """Drop pooled connections and per-host memos."""
+    close_pooled_connections()
+    server._key_auth_failed.clear()
+    server._sudo_validated.clear()
+    server._sudo_timestamp_unshared.clear()
+    server._puppet_locked_at.clear()
+
+
+@pytest.fixture(autouse=True)
+def clean_ssh_pool():
+    """Reset connection and memo state so tests don't bleed into each other."""
+    _reset_server_state()
+    yield
+    _reset_server_state()
+
+
+def make_exec_mocks(stdout=b'', stderr=b'', status=0):
+    """Build (stdin, stdout, stderr) mocks matching paramiko's exec_command."""
+    channel = MagicMock()
+    out_chunks = [stdout] if stdout else []
+    err_chunks = [stderr] if stderr else []
+    channel.exit_status_ready.return_value = True
+    channel.recv_ready.side_effect = lambda: bool(out_chunks)
+    channel.recv.side_effect = lambda size: out_chunks.pop(0)
+    channel.recv_stderr_ready.side_effect = lambda: bool(err_chunks)
+    channel.recv_stderr.side_effect = lambda size: err_chunks.pop(0)
+    channel.recv_exit_status.return_value = status
+
+    mock_stdin = MagicMock()
+    mock_stdout = MagicMock()
+    mock_stdout.channel = channel
+    mock_stderr = MagicMock()
+    return mock_stdin, mock_stdout, mock_stderr
 
 
 class TestSSHServer:
     """Test SSH server functionality."""
-    
+
     @patch('ssh_mcp_server.server.credential_manager')
     @patch('paramiko.SSHClient')
     def test_execute_ssh_success(self, mock_ssh_client, mock_credential_manager):
         """Test successful SSH command execution."""
         # Mock credential manager
-        mock_credential_manager.test_credentials_available.return_value = True
-        mock_credential_manager.get_domain_from_hostname.return_value = 'vocus.local'
         mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
-        
+
         # Mock SSH client
         mock_ssh = MagicMock()
         mock_ssh_client.return_value = mock_ssh
-        
+
         # Mock command execution
-        mock_stdout = MagicMock()
-        mock_stdout.read.return_value = b'command output'
-        mock_stdout.channel.recv_exit_status.return_value = 0
-        
-        mock_stderr = MagicMock()
-        mock_stderr.read.return_value = b''
-        
-        mock_ssh.exec_command.return_value = (None, mock_stdout, mock_stderr)
-        
+        mock_ssh.exec_command.return_value = make_exec_mocks(stdout=b'command output')
+
         # Execute test
-        result = execute_ssh('test.vocus.local', 'ls -la')
-        
+        result = ssh_execute_ssh('test.vocus.local', 'ls -la')
+
         # Verify result
-        assert result['success'] is True
-        assert result['exit_code'] == 0
+        assert result['status'] == 0
         assert result['stdout'] == 'command output'
         assert result['hostname'] == 'test.vocus.local'
         assert result['command'] == 'ls -la'
-    
+
     @patch('ssh_mcp_server.server.credential_manager')
-    def test_execute_ssh_no_credentials(self, mock_credential_manager):
-        """Test SSH execution when no credentials available."""
-        mock_credential_manager.test_credentials_available.return_value = False
-        mock_credential_manager.get_domain_from_hostname.return_value = 'vocus.local'
-        
-        result = execute_ssh('test.vocus.local', 'ls -la')
-        
-        assert 'error' in result
-        assert 'No credentials found' in result['error']
-    
+    @patch('paramiko.SSHClient')
+    def test_execute_ssh_binary(self, mock_ssh_client, mock_credential_manager):
+        """Test binary mode returns base64-encoded output without decoding."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+        mock_ssh.exec_command.return_value = make_exec_mocks(stdout=b'\xff\xfe\x00raw')
+
+        result = ssh_execute_ssh('test.vocus.local', 'cat file.bin', binary=True)
+
+        assert result['status'] == 0
+        assert result['encoding'] == 'base64'
+        assert base64.b64decode(result['stdout']) == b'\xff\xfe\x00raw'
+        assert base64.b64decode(result['stderr']) == b''
+        assert result['stdout_truncated'] is False
+        assert result['stderr_truncated'] is False
+
+    @patch('ssh_mcp_server.server.credential_manager')
+    @patch('paramiko.SSHClient')
+    def test_execute_ssh_binary_via_tool_dispatch(self, mock_ssh_client,
+                                                  mock_credential_manager):
+        """Test non-UTF-8 binary output survives MCP tool serialization."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+        mock_ssh.exec_command.return_value = make_exec_mocks(stdout=b'\xff\xfe\x00raw')
+
+        contents, structured = asyncio.run(mcp.call_tool('ssh_execute_ssh', {
+            'hostname': 'test.vocus.local',
+            'command': 'cat file.bin',
+            'binary': True,
+        }))
+
+        result = json.loads(contents[0].text)
+        assert result['status'] == 0
+        assert base64.b64decode(result['stdout']) == b'\xff\xfe\x00raw'
+        assert structured['result']['stdout'] == result['stdout']
+
+    @patch('ssh_mcp_server.server.credential_manager')
+    @patch('paramiko.SSHClient')
+    def test_execute_ssh_reuses_pooled_connection(self, mock_ssh_client,
+                                                  mock_credential_manager):
+        """Test that back-to-back calls reuse the pooled connection."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+
+        mock_ssh.exec_command.side_effect = lambda *a, **kw: make_exec_mocks(stdout=b'ok')
+
+        ssh_execute_ssh('test.vocus.local', 'uptime')
+        ssh_execute_ssh('test.vocus.local', 'uptime')
+
+        # One client created and connected, two commands executed
+        assert mock_ssh_client.call_count == 1
+        assert mock_ssh.connect.call_count == 1
+        assert mock_ssh.exec_command.call_count == 2
+
+    @patch('ssh_mcp_server.server.credential_manager')
+    @patch('paramiko.SSHClient')
+    def test_eviction_skips_checked_out_connection(self, mock_ssh_client,
+                                                   mock_credential_manager):
+        """Test the idle sweep never closes a connection that is in use."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+        mock_ssh.exec_command.side_effect = lambda *a, **kw: make_exec_mocks(stdout=b'ok')
+
+        ssh_execute_ssh('test.vocus.local', 'uptime')
+
+        # Check the client out as a long-running command would, then age the
+        # entry past the idle limit and sweep
+        key = ('test.vocus.local', 'testuser')
+        client = server._get_pooled_client(*key)
+        server._ssh_pool[key][1] -= server.SSH_POOL_IDLE_SECONDS + 10
+        server._evict_idle_connections()
+
+        assert not mock_ssh.close.called
+        assert key in server._ssh_pool
+
+        # Once released (and aged again), the sweep may close it
+        server._release_client(client)
+        server._ssh_pool[key][1] -= server.SSH_POOL_IDLE_SECONDS + 10
+        server._evict_idle_connections()
+
+        assert mock_ssh.close.called
+        assert key not in server._ssh_pool
+
+    @patch('ssh_mcp_server.server.get_credentials')
+    @patch('ssh_mcp_server.server.credential_manager')
+    @patch('paramiko.SSHClient')
+    def test_key_auth_skip_does_not_refresh_window(self, mock_ssh_client,
+                                                   mock_credential_manager,
+                                                   mock_get_credentials):
+        """Test a skipped key attempt leaves the failure timestamp alone."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+        mock_get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+        mock_ssh.exec_command.side_effect = lambda *a, **kw: make_exec_mocks(stdout=b'ok')
+
+        # A key-auth failure was recorded moments ago
+        key = ('test.vocus.local', 'testuser')
+        recorded_at = time.monotonic() - 10
+        server._key_auth_failed[key] = recorded_at
+
+        ssh_execute_ssh('test.vocus.local', 'uptime')
+
+        # The key attempt was skipped (single connect, straight to password)
+        # and the skip did not restart the retry window
+        assert mock_ssh.connect.call_count == 1
+        assert mock_ssh.connect.call_args.kwargs['password'] == 'testpass'
+        assert server._key_auth_failed[key] == recorded_at
+
+    def test_pool_replacement_defers_close_of_in_use_client(self):
+        """Test replacing a pooled entry doesn't close a client mid-command."""
+        first = MagicMock()
+        second = MagicMock()
+
+        # Both connectors pool their own client; the second displaces the
+        # first while it is still checked out by its connecting thread
+        server._pool_client('test.vocus.local', 'testuser', first)
+        server._pool_client('test.vocus.local', 'testuser', second)
+
+        assert not first.close.called
+
+        server._release_client(first)
+        assert first.close.called
+
+        server._release_client(second)
+        assert not second.close.called
+
+    @patch('ssh_mcp_server.server.credential_manager')
+    @patch('paramiko.SSHClient')
+    def test_ssh_session_pins_client(self, mock_ssh_client, mock_credential_manager):
+        """Test that calls inside ssh_session share one pinned client."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+        mock_ssh.exec_command.side_effect = lambda *a, **kw: make_exec_mocks(stdout=b'ok')
+
+        with ssh_session('test.vocus.local') as session:
+            ssh_execute_ssh('test.vocus.local', 'uptime')
+            ssh_execute_ssh('test.vocus.local', 'uptime')
+            assert session['client'] is mock_ssh
+
+        assert mock_ssh.connect.call_count == 1
+
     @patch('ssh_mcp_server.server.credential_manager')
     @patch('paramiko.SSHClient')
     def test_execute_ssh_connection_failure(self, mock_ssh_client, mock_credential_manager):
         """Test SSH execution with connection failure."""
         # Mock credential manager
-        mock_credential_manager.test_credentials_available.return_value = True
-        mock_credential_manager.get_domain_from_hostname.return_value = 'vocus.local'
         mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
-        
+
         # Mock SSH client to raise exception
         mock_ssh = MagicMock()
         mock_ssh_client.return_value = mock_ssh
-        mock_ssh.connect.side_effect = Exception('Connection failed')
-        
-        result = execute_ssh('test.vocus.local', 'ls -la')
-        
+        mock_ssh.connect.side_effect = paramiko.SSHException('Connection failed')
+
+        result = ssh_execute_ssh('test.vocus.local', 'ls -la')
+
         assert 'error' in result
         assert 'SSH connection failed' in result['error']
-    
-    @patch('ssh_mcp_server.server.execute_ssh')
+
+    @patch('ssh_mcp_server.server.credential_manager')
+    @patch('paramiko.SSHClient')
+    def test_sudo_noninteractive_probe_paid_once(self, mock_ssh_client,
+                                                 mock_credential_manager):
+        """Test a host that rejects sudo -n is only ever probed once."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+
+        commands = []
+
+        def fake_exec(cmd, get_pty=False):
+            commands.append(cmd)
+            if cmd.startswith('sudo -n '):
+                return make_exec_mocks(
+                    stderr=b'sudo: a password is required\n', status=1
+                )
+            return make_exec_mocks(stdout=b'done')
+
+        mock_ssh.exec_command.side_effect = fake_exec
+
+        ssh_execute_sudo('test.vocus.local', 'true')  # -S, records timestamp
+        ssh_execute_sudo('test.vocus.local', 'true')  # -n refused, falls back
+        ssh_execute_sudo('test.vocus.local', 'true')  # probe not repeated
+
+        assert [c.split()[:2] for c in commands] == [
+            ['sudo', '-S'],
+            ['sudo', '-n'], ['sudo', '-S'],
+            ['sudo', '-S'],
+        ]
+
+    @patch('ssh_mcp_server.server.credential_manager')
+    @patch('paramiko.SSHClient')
+    def test_puppet_noop_command_is_sudo_compatible(self, mock_ssh_client,
+                                                    mock_credential_manager):
+        """Test the puppet lock gate reaches sudo as a single command."""
+        mock_credential_manager.get_credentials.return_value = ('testuser', 'testpass')
+
+        mock_ssh = MagicMock()
+        mock_ssh_client.return_value = mock_ssh
+        mock_ssh.exec_command.side_effect = lambda *a, **kw: make_exec_mocks(
+            stdout=b'__PUPPET_LOCKED__\n', status=2
+        )
+
+        result = ssh_puppet_noop('test.vocus.local')
+
+        # sudo receives sh -c plus exactly one argument holding the whole
+        # compound statement, not bare if/then control flow it can't run
+        remote_cmd = mock_ssh.exec_command.call_args.args[0]
+        argv = shlex.split(remote_cmd)
+        assert argv[:4] == ['sudo', '-S', 'sh', '-c']
+        assert len(argv) == 5
+        assert argv[4].startswith('if [ -e ')
+        assert '__PUPPET_LOCKED__' in argv[4]
+
+        # exit 2 plus the sentinel maps to the locked error, and the
+        # cached lock answers the next call without another SSH exec
+        assert result['error'] == 'Puppet agent is already running'
+        calls_before = mock_ssh.exec_command.call_count
+        result2 = ssh_puppet_noop('test.vocus.local')
+        assert result2['error'] == 'Puppet agent is already running'
+        assert mock_ssh.exec_command.call_count == calls_before
+
+    @patch('ssh_mcp_server.server.ssh_execute_ssh')
+    def test_execute_ssh_many(self, mock_execute_ssh):
+        """Test concurrent fan-out over multiple hosts."""
+        mock_execute_ssh.side_effect = lambda host, command: {
+            'status': 0, 'hostname': host, 'command': command
+        }
+
+        result = ssh_execute_ssh_many(['a.vocus.local', 'b.vocus.local'], 'uptime')
+
+        assert set(result) == {'a.vocus.local', 'b.vocus.local'}
+        assert result['a.vocus.local']['status'] == 0
+        assert mock_execute_ssh.call_count == 2
+
+    def test_execute_ssh_many_empty(self):
+        """Test fan-out with no hosts."""
+        assert ssh_execute_ssh_many([], 'uptime') == {}
+
+    @patch('ssh_mcp_server.server.ssh_execute_ssh')
     def test_get_system_info(self, mock_execute_ssh):
-        """Test system info retrieval."""
+        """Test system info retrieval and section parsing."""
         mock_execute_ssh.return_value = {
-            'success': True,
-            'stdout': 'Linux test 5.4.0 x86_64'
+            'status': 0,
+            'stdout': (
+                '\x1euname\nLinux test 5.4.0 x86_64\n'
+                '\x1eos_release\nNAME="Test Linux"\n'
+                '\x1ememory\nMem: 8G\n'
+                '\x1edisk\n/dev/sda1 50G\n'
+            )
         }
-        
-        result = get_system_info('test.vocus.local')
-        
-        assert result['success'] is True
-        mock_execute_ssh.assert_called_once_with(
-            'test.vocus.local',
-            'uname -a && uptime && df -h / && free -h'
-        )
+
+        result = ssh_get_system_info('test.vocus.local')
+
+        assert result['status'] == 0
+        assert result['system_info']['uname'] == 'Linux test 5.4.0 x86_64'
+        assert result['system_info']['os_release'] == 'NAME="Test Linux"'
+        assert result['system_info']['memory'] == 'Mem: 8G'
+        assert result['system_info']['disk'] == '/dev/sda1 50G'
+        mock_execute_ssh.assert_called_once()